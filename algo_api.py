@@ -1,10 +1,12 @@
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List
 from fastapi.middleware.cors import CORSMiddleware
-from algorithm import DynamicTrafficController
+from algorithm import DynamicTrafficController, warm_up
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # ------------------ CORS------------------ #
 app.add_middleware(
@@ -18,6 +20,12 @@ app.add_middleware(
 controller = None
 current_lanes = []
 
+
+@app.on_event("startup")
+async def _warm_kernels():
+    # compile the controller's JIT kernels before the first /update
+    await asyncio.to_thread(warm_up)
+
 class LaneInput(BaseModel):
     lane_id: str
     normal: int
@@ -25,11 +33,10 @@ class LaneInput(BaseModel):
 
 
 @app.post("/update")
-def update_signal(input_data: List[LaneInput]):
+async def update_signal(input_data: List[LaneInput]):
     global controller, current_lanes
 
-    lane_list = [item.dict() for item in input_data]
-    incoming_lanes = [lane["lane_id"] for lane in lane_list]
+    incoming_lanes = [lane.lane_id for lane in input_data]
 
     if controller is None or set(incoming_lanes) != set(current_lanes):
         controller = DynamicTrafficController(
@@ -38,23 +45,17 @@ def update_signal(input_data: List[LaneInput]):
             max_green=12.0,
             yellow_time=2.0,
             clearance_rate=2.5,
-            debug=False
+            debug=False,
+            lane_ids=incoming_lanes
         )
 
-        controller.lane_ids = incoming_lanes
-
-        controller.lanes = {
-            lane_id: {"normal": 0, "emergency": 0, "wait": 0, "state": [1, 0, 0]}
-            for lane_id in incoming_lanes
-        }
-
         current_lanes = incoming_lanes
 
-    result = controller.update(lane_list)
+    result = controller.update(input_data)
 
     return {"status": "success", "output": result}
 
 
 @app.get("/status")
-def get_status():
+async def get_status():
     return controller.lanes if controller else {}
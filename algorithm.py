@@ -1,6 +1,64 @@
 import time
-import random
-from typing import List, Dict, Any
+from typing import Iterable, List, Dict, Any, Optional, Protocol
+import numpy as np
+from numba import njit
+
+# Signal states as [red, yellow, green]
+RED = (1, 0, 0)
+YELLOW = (0, 1, 0)
+GREEN = (0, 0, 1)
+
+
+class LaneReading(Protocol):
+    """Per-lane vehicle counts for one tick (e.g. algo_api.LaneInput)."""
+    lane_id: str
+    normal: int
+    emergency: int
+
+
+# Selection kernels: one pass over the lane arrays, no temporaries
+@njit(cache=True)
+def _pick_normal(normal, wait, wait_boost, starvation_limit):
+    best = 0
+    best_score = -np.inf
+    for i in range(normal.shape[0]):
+        # Base score proportional to number of vehicles and wait boost
+        score = normal[i] * (1.0 + wait[i] * wait_boost)
+
+        # Starvation prevention
+        if wait[i] >= starvation_limit:
+            score += 1000.0
+
+        if score > best_score:
+            best_score = score
+            best = i
+    return best
+
+
+@njit(cache=True)
+def _pick_emergency(emergency, start):
+    n = emergency.shape[0]
+    max_count = 0
+    for i in range(n):
+        if emergency[i] > max_count:
+            max_count = emergency[i]
+    if max_count <= 0:
+        return -1
+
+    # First lane tied on the highest count, scanning round-robin from start
+    for k in range(n):
+        i = (start + k) % n
+        if emergency[i] == max_count:
+            return i
+    return -1
+
+
+def warm_up():
+    """Compile (or load cached) selection kernels before the first update."""
+    lanes = np.zeros(1, dtype=np.int32)
+    _pick_normal(lanes, lanes, 0.4, 8)
+    _pick_emergency(lanes, 0)
+
 
 class DynamicTrafficController:
     """
@@ -9,6 +67,9 @@ class DynamicTrafficController:
       - Number of emergency and normal vehicles
       - Lane waiting time (aging/fairness)
       - Dynamic green time proportional to traffic volume
+
+    Per-lane state is kept as parallel NumPy arrays (indexed via
+    `lane_index`) so scoring and selection run as compiled array loops.
     """
 
     def __init__(
@@ -20,20 +81,27 @@ class DynamicTrafficController:
         wait_boost: float = 0.4,
         starvation_limit: int = 8,
         clearance_rate: float = 3.0,
-        debug: bool = True
+        debug: bool = True,
+        simulate: bool = False,
+        lane_ids: Optional[List[str]] = None
     ):
         # Initialize lane data
-        self.lane_ids = [f"Lane_{i+1}" for i in range(N)]
-        self.lanes = {
-            lane: {"normal": 0, "emergency": 0, "wait": 0, "state": [1, 0, 0]}
-            for lane in self.lane_ids
-        }
+        if lane_ids is None:
+            lane_ids = [f"Lane_{i+1}" for i in range(N)]
+        self.lane_ids = list(lane_ids)
+        self.N = len(self.lane_ids)
+        self.lane_index = {lane: i for i, lane in enumerate(self.lane_ids)}
+
+        self.normal = np.zeros(self.N, dtype=np.int32)
+        self.emergency = np.zeros(self.N, dtype=np.int32)
+        self.wait = np.zeros(self.N, dtype=np.int32)
+        self.state = np.tile(np.array(RED, dtype=np.int8), (self.N, 1))
 
         # State tracking
         self.current_green = None
-        self.green_started_at = None
+        self._green_expires_at = 0.0
         self.current_green_time = min_green
-        self.last_emergency_lane = None
+        self.last_emergency_idx = -1
 
         # Parameters
         self.yellow_time = yellow_time
@@ -43,63 +111,41 @@ class DynamicTrafficController:
         self.starvation_limit = starvation_limit
         self.clearance_rate = clearance_rate
         self.debug = debug
+        self.simulate = simulate
+        self._rng = np.random.default_rng()
+
+    @property
+    def lanes(self) -> Dict[str, Dict[str, Any]]:
+        """Per-lane snapshot in the original dict-of-dicts shape."""
+        normal = self.normal.tolist()
+        emergency = self.emergency.tolist()
+        wait = self.wait.tolist()
+        state = self.state.tolist()
+        return {
+            lane: {"normal": normal[i], "emergency": emergency[i], "wait": wait[i], "state": state[i]}
+            for i, lane in enumerate(self.lane_ids)
+        }
 
     # Emergency lane chooser (highest priority)
-    def _choose_emergency_lane(self, data: Dict[str, Any]):
-        emergencies = [l for l in data if data[l]["emergency"] > 0]
-        if not emergencies:
+    def _choose_emergency_lane(self, emergency: np.ndarray) -> Optional[int]:
+        # Round-robin tie breaker starts after the last emergency pick
+        start = (self.last_emergency_idx + 1) % self.N
+        chosen = int(_pick_emergency(emergency, start))
+        if chosen < 0:
             return None
-
-        # Select lane with highest emergency count
-        max_count = max(data[l]["emergency"] for l in emergencies)
-        tied = [l for l in emergencies if data[l]["emergency"] == max_count]
-
-        # Round-robin tie breaker
-        if len(tied) == 1:
-            chosen = tied[0]
-        else:
-            start = 0
-            if self.last_emergency_lane in self.lane_ids:
-                start = (self.lane_ids.index(self.last_emergency_lane) + 1) % len(self.lane_ids)
-            for i in range(len(self.lane_ids)):
-                lane = self.lane_ids[(start + i) % len(self.lane_ids)]
-                if lane in tied:
-                    chosen = lane
-                    break
-            else:
-                chosen = tied[0]
-        self.last_emergency_lane = chosen
+        self.last_emergency_idx = chosen
         return chosen
 
     # Normal lane chooser (vehicles + fairness)
-    def _choose_normal_lane(self, data: Dict[str, Any]):
-        scores = {}
-        for lane in self.lane_ids:
-            n = data[lane]["normal"]
-            w = data[lane]["wait"]
-
-            # Base score proportional to number of vehicles and wait boost
-            score = n * (1 + w * self.wait_boost)
-
-            # Starvation prevention
-            if w >= self.starvation_limit:
-                score += 1000
-
-            scores[lane] = score
-
-        chosen = max(scores, key=scores.get)
-        return chosen
+    def _choose_normal_lane(self, normal: np.ndarray) -> int:
+        return int(_pick_normal(normal, self.wait, self.wait_boost, self.starvation_limit))
 
     # Dynamic green time calculation
-    def _calculate_green_time(self, lane_data):
+    def _calculate_green_time(self, normal: int, emergency: int, wait: int) -> float:
         """
         Green time proportional to vehicle count, capped between min & max.
         Emergency vehicles add extra time.
         """
-        normal = lane_data["normal"]
-        emergency = lane_data["emergency"]
-        wait = lane_data["wait"]
-
         # Balanced formula (recommended)
         clear_time = normal / self.clearance_rate
         wait_bonus = wait * 0.4
@@ -107,99 +153,89 @@ class DynamicTrafficController:
 
         base_time = clear_time + wait_bonus + emergency_bonus
         green_time = max(self.min_green, min(base_time, self.max_green))
-        return green_time
+        return float(green_time)
 
     # Transition phase (yellow then green)
-    def _apply_yellow(self, to_green: str):
-        for lane in self.lane_ids:
-            if lane == to_green:
-                self.lanes[lane]["state"] = [0, 1, 0]  # yellow
-            else:
-                self.lanes[lane]["state"] = [1, 0, 0]  # red
+    def _apply_yellow(self, to_green: int):
+        self.state[:] = RED
+        self.state[to_green] = YELLOW
 
         # Transition instantly to green
-        self.lanes[to_green]["state"] = [0, 0, 1]
-        self.current_green = to_green
-        self.green_started_at = time.time()
+        self.state[to_green] = GREEN
+        self.current_green = self.lane_ids[to_green]
+        self._green_expires_at = time.monotonic() + self.current_green_time
 
     # Update wait counters
-    def _update_waits(self, chosen: str):
-        for lane in self.lane_ids:
-            if lane == chosen:
-                self.lanes[lane]["wait"] = 0
-            else:
-                self.lanes[lane]["wait"] += 1
+    def _update_waits(self, chosen: int):
+        self.wait += 1
+        self.wait[chosen] = 0
+
+    # Simulate vehicle flow (off unless simulate=True)
+    def _simulate_flow(self, normal: np.ndarray, chosen: int, green_time: float):
+        if not self.simulate:
+            return
 
-    # Simulate vehicle flow
-    def _simulate_flow(self, data: Dict[str, Any], chosen: str, green_time: float):
-        normal = data[chosen]["normal"]
-        cleared = min(normal, int(self.clearance_rate * green_time))
-        data[chosen]["normal"] -= cleared
+        cleared = min(int(normal[chosen]), int(self.clearance_rate * green_time))
+        normal[chosen] -= cleared
 
         # New random arrivals in other lanes
-        for lane in self.lane_ids:
-            if lane != chosen:
-                data[lane]["normal"] += random.randint(0, 3)
+        arrivals = self._rng.integers(0, 4, size=self.N, dtype=np.int32)
+        arrivals[chosen] = 0
+        normal += arrivals
 
     # Main update function
-    def update(self, lanes_data: List[Dict[str, Any]]) -> Dict[str, Any]:
-
-        # Prepare internal data
-        data = {
-            d["lane_id"]: {
-                "normal": d["normal"],
-                "emergency": d["emergency"],
-                "wait": self.lanes[d["lane_id"]]["wait"]
-            }
-            for d in lanes_data
-        }
+    def update(self, lanes_data: Iterable[LaneReading]) -> Dict[str, Any]:
+
+        # Write incoming counts in place; lanes missing from this tick are empty
+        normal = self.normal
+        emergency = self.emergency
+        normal[:] = 0
+        emergency[:] = 0
+        for d in lanes_data:
+            i = self.lane_index[d.lane_id]
+            normal[i] = d.normal
+            emergency[i] = d.emergency
 
         # Step 1: Emergencies first
-        chosen = self._choose_emergency_lane(data)
+        chosen = self._choose_emergency_lane(emergency)
 
         # Step 2: Normal lane selection if no emergency
-        if not chosen:
-            if self.current_green and self.green_started_at:
-                elapsed = time.time() - self.green_started_at
-                if elapsed < self.current_green_time:
-                    chosen = self.current_green
-                else:
-                    chosen = self._choose_normal_lane(data)
+        if chosen is None:
+            if self.current_green is not None and time.monotonic() < self._green_expires_at:
+                chosen = self.lane_index[self.current_green]
             else:
-                chosen = self._choose_normal_lane(data)
+                chosen = self._choose_normal_lane(normal)
 
-        # Step 3: Update wait times
-        self._update_waits(chosen)
+        # Step 3: Calculate dynamic green time (from the wait before this tick)
+        self.current_green_time = self._calculate_green_time(
+            int(normal[chosen]), int(emergency[chosen]), int(self.wait[chosen])
+        )
 
-        # Step 4: Calculate dynamic green time
-        self.current_green_time = self._calculate_green_time(data[chosen])
+        # Step 4: Update wait times
+        self._update_waits(chosen)
 
         # Step 5: Apply yellow → green
         self._apply_yellow(chosen)
 
         # Step 6: Simulate flow
-        self._simulate_flow(data, chosen, self.current_green_time)
-
-        # Step 7: Update internal queues
-        for lane in self.lane_ids:
-            self.lanes[lane]["normal"] = data[lane]["normal"]
+        self._simulate_flow(normal, chosen, self.current_green_time)
 
         # Debug output
         if self.debug:
             print("\n==============================")
-            print(f" Active Green: {chosen}")
+            print(f" Active Green: {self.current_green}")
             print(f" Green Time  : {self.current_green_time:.1f}s")
-            print(f" Wait Times  : {[self.lanes[l]['wait'] for l in self.lane_ids]}")
-            print(" Lane States :", {l: self.lanes[l]["state"] for l in self.lane_ids})
+            print(f" Wait Times  : {self.wait.tolist()}")
+            print(" Lane States :", dict(zip(self.lane_ids, self.state.tolist())))
             print("==============================\n")
 
         # Final enriched output (state + wait + green time)
-        output = {}
-        for lane in self.lane_ids:
-            output[lane] = {
-                "state": self.lanes[lane]["state"],
-                "wait": self.lanes[lane]["wait"],
-            }
+        state = self.state.tolist()
+        wait = self.wait.tolist()
+        output = {
+            lane: {"state": state[i], "wait": wait[i]}
+            for i, lane in enumerate(self.lane_ids)
+        }
 
         # Only current green lane has green_time
         output[self.current_green]["green_time"] = self.current_green_time
@@ -209,6 +245,9 @@ class DynamicTrafficController:
 
 # # ===================== Simulation Example ===================== #
 
+# import random
+# from types import SimpleNamespace
+
 # # Create a controller for 4 lanes
 # controller = DynamicTrafficController(
 #     N=4,
@@ -216,15 +255,16 @@ class DynamicTrafficController:
 #     max_green=12.0,
 #     yellow_time=2.0,
 #     clearance_rate=2.5,
-#     debug=True
+#     debug=True,
+#     simulate=True
 # )
 
 # # Initialize random vehicle counts
 # lanes_data = [
-#     {"lane_id": "Lane_1", "normal": 5, "emergency": 0},
-#     {"lane_id": "Lane_2", "normal": 3, "emergency": 0},
-#     {"lane_id": "Lane_3", "normal": 6, "emergency": 0},
-#     {"lane_id": "Lane_4", "normal": 4, "emergency": 0},
+#     SimpleNamespace(lane_id="Lane_1", normal=5, emergency=0),
+#     SimpleNamespace(lane_id="Lane_2", normal=3, emergency=0),
+#     SimpleNamespace(lane_id="Lane_3", normal=6, emergency=0),
+#     SimpleNamespace(lane_id="Lane_4", normal=4, emergency=0),
 # ]
 
 # # Run simulation for 10 cycles
@@ -233,8 +273,8 @@ class DynamicTrafficController:
 
 #     # Random new vehicles + occasional emergency
 #     for lane in lanes_data:
-#         lane["normal"] += random.randint(0, 3)
-#         lane["emergency"] = 1 if random.random() < 0.1 else 0
+#         lane.normal += random.randint(0, 3)
+#         lane.emergency = 1 if random.random() < 0.1 else 0
 
 #     # Feed to controller
 #     output = controller.update(lanes_data)
@@ -1,11 +1,35 @@
 # embedder.py
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
 import numpy as np
+import tensorflow as tf
 from PIL import Image
-from tensorflow.keras.applications.resnet50 import ResNet50, preprocess_input
-from tensorflow.keras.preprocessing.image import img_to_array
+from tensorflow.keras.applications.resnet50 import ResNet50
 
 # create a single global ResNet50 instance (include_top=False, pooling='avg' -> 2048-dim vector)
 _resnet = None
+_resnet_fn = None
+
+# optional int8 TFLite export of the same model (see export_tflite); used
+# instead of the Keras model when the file exists
+TFLITE_PATH = os.getenv("EMBEDDER_TFLITE_PATH", "resnet50_int8.tflite")
+_interpreter = None
+
+# LRU of embeddings keyed by a hash of the resized crop (~8 KB per entry)
+CACHE_SIZE = 2048
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# ResNet50 ("caffe") preprocessing: BGR channel order minus ImageNet means
+_MEAN_BGR = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+# reusable (B, H, W, 3) input buffer, grown on demand
+MAX_BATCH = 32
+_batch_buf = None
+_batch_lock = threading.Lock()
 
 def get_resnet():
     global _resnet
@@ -13,17 +37,145 @@ def get_resnet():
         _resnet = ResNet50(weights='imagenet', include_top=False, pooling='avg')
     return _resnet
 
+def get_resnet_fn():
+    """Traced forward pass, avoiding Keras predict() overhead per call."""
+    global _resnet_fn
+    if _resnet_fn is None:
+        model = get_resnet()
+        _resnet_fn = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec([None, None, None, 3], tf.float32)],
+        )
+    return _resnet_fn
+
+def get_interpreter():
+    global _interpreter
+    if _interpreter is None and os.path.exists(TFLITE_PATH):
+        _interpreter = tf.lite.Interpreter(model_path=TFLITE_PATH, num_threads=os.cpu_count())
+        _interpreter.allocate_tensors()
+    return _interpreter
+
+def _forward(arr):
+    """
+    arr: preprocessed float32 batch (B,H,W,3)
+    returns: 2D numpy array (B, 2048); callers must hold _batch_lock
+    """
+    interpreter = get_interpreter()
+    if interpreter is not None:
+        inp = interpreter.get_input_details()[0]
+        if tuple(inp["shape"][1:3]) == arr.shape[1:3]:
+            if inp["shape"][0] != arr.shape[0]:
+                interpreter.resize_tensor_input(inp["index"], arr.shape)
+                interpreter.allocate_tensors()
+            interpreter.set_tensor(inp["index"], arr)
+            interpreter.invoke()
+            return interpreter.get_tensor(interpreter.get_output_details()[0]["index"]).copy()
+    return get_resnet_fn()(tf.constant(arr)).numpy()
+
+def export_tflite(path=TFLITE_PATH, sample_images=None, target_size=(224,224)):
+    """
+    One-time conversion of the embedder to a quantized TFLite model.
+    sample_images: representative crops (PIL images or arrays) used to
+    calibrate full int8 quantization; without them only the weights are
+    quantized. The classifier was trained on FP32 embeddings, so re-check
+    its accuracy on the quantized embeddings before deploying the file.
+    """
+    w, h = target_size
+    model = ResNet50(weights='imagenet', include_top=False, pooling='avg', input_shape=(h, w, 3))
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if sample_images:
+        def representative_dataset():
+            for img in sample_images:
+                arr = np.empty((1, h, w, 3), dtype=np.float32)
+                _fill(arr, [_prepare(img, target_size)])
+                yield [arr]
+        converter.representative_dataset = representative_dataset
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+
+def warm_up(target_size=(224,224)):
+    """Build the model and run one dummy batch so the first request skips tracing."""
+    w, h = target_size
+    with _batch_lock:
+        _forward(np.zeros((1, h, w, 3), dtype=np.float32))
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+def _prepare(pil_image, target_size):
+    if not hasattr(pil_image, "resize"):
+        pil_image = Image.fromarray(pil_image[..., ::-1])  # if BGR (cv2) -> convert to RGB
+    if pil_image.mode != "RGB":
+        pil_image = pil_image.convert("RGB")
+    return pil_image.resize(target_size, Image.BILINEAR)
+
+def _get_batch_buf(batch, target_size):
+    global _batch_buf
+    w, h = target_size
+    if _batch_buf is None or _batch_buf.shape[0] < batch or _batch_buf.shape[1:3] != (h, w):
+        _batch_buf = np.empty((max(batch, MAX_BATCH), h, w, 3), dtype=np.float32)
+    return _batch_buf[:batch]
+
+def _fill(arr, imgs):
+    # ResNet50 preprocessing into arr, in place
+    for row, img in zip(arr, imgs):
+        np.copyto(row, np.asarray(img)[..., ::-1])  # RGB -> BGR
+    arr -= _MEAN_BGR
+
+def images_to_embeddings(pil_list, target_size=(224,224)):
+    """
+    pil_list: list of PIL.Image instances (RGB) or numpy arrays (H,W,3)
+    returns: 2D numpy array (B, 2048), one row per input image
+    """
+    imgs = [_prepare(p, target_size) for p in pil_list]
+    if not imgs:
+        return np.empty((0, 2048), dtype=np.float32)
+
+    # identical crops (common across frames) reuse the cached vector
+    keys = [(img.size, hashlib.blake2b(img.tobytes(), digest_size=16).digest()) for img in imgs]
+    out = [None] * len(imgs)
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            emb = _cache.get(key)
+            if emb is not None:
+                _cache.move_to_end(key)
+                out[i] = emb
+
+    # one forward pass for every distinct uncached crop
+    pending = {}
+    for i, key in enumerate(keys):
+        if out[i] is None:
+            pending.setdefault(key, []).append(i)
+    if pending:
+        with _batch_lock:
+            arr = _get_batch_buf(len(pending), target_size)
+            _fill(arr, [imgs[rows[0]] for rows in pending.values()])
+            embs = _forward(arr)             # shape (B, 2048)
+        embs.setflags(write=False)       # rows are shared between callers via the cache
+        with _cache_lock:
+            for emb, (key, rows) in zip(embs, pending.items()):
+                for i in rows:
+                    out[i] = emb
+                _cache[key] = emb
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    return np.stack(out)
+
 def image_to_embedding(pil_image, target_size=(224,224)):
     """
     pil_image: PIL.Image instance (RGB) or numpy array (H,W,3)
     returns: 1D numpy array (e.g., length 2048)
     """
-    if not hasattr(pil_image, "resize"):
-        pil_image = Image.fromarray(pil_image[..., ::-1])  # if BGR (cv2) -> convert to RGB
-    img = pil_image.resize(target_size)
-    arr = img_to_array(img)
-    arr = np.expand_dims(arr, axis=0)
-    arr = preprocess_input(arr)          # ResNet50 preprocessing
-    model = get_resnet()
-    emb = model.predict(arr, verbose=0)  # shape (1, 2048)
-    return emb.ravel()                   # shape (2048,)
+    return images_to_embeddings([pil_image], target_size)[0]
+
+if __name__ == "__main__":
+    # python embedder.py [calibration_image_dir]
+    samples = None
+    if len(sys.argv) > 1:
+        folder = sys.argv[1]
+        samples = [Image.open(os.path.join(folder, f)) for f in sorted(os.listdir(folder))[:200]]
+    export_tflite(sample_images=samples)
+    print(f"Saved {TFLITE_PATH}")
@@ -1,17 +1,20 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import joblib, traceback, base64, io, os, requests
+from fastapi.responses import ORJSONResponse
+import joblib, traceback, io, os, asyncio, contextlib, httpx, pybase64
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from PIL import Image
 import numpy as np
-from embedder import image_to_embedding
+from embedder import images_to_embeddings, warm_up
 
 TRAFFIC_API_URL = "https://dynamictrafficalgo-1.onrender.com/update"
 MODEL_PATH = "vehicle_classifier.pkl"
 LABEL_PATH = "label_encoder.pkl"
+CROP_SIZE = (224, 224)  # ResNet input size; JPEG crops are decoded near it
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "2"))  # concurrent requests running ResNet
 
-app = FastAPI(title="ML -> Traffic API")
+app = FastAPI(title="ML -> Traffic API", default_response_class=ORJSONResponse)
 
 # Enable CORS for browser dashboard
 app.add_middleware(
@@ -22,6 +25,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# requests carrying crops queue here instead of contending for the model
+EMB_SEM = asyncio.Semaphore(MAX_INFLIGHT)
+
+# shared async HTTP client for the traffic controller (closed on shutdown)
+client = httpx.AsyncClient(timeout=60)
+
+@app.on_event("shutdown")
+async def _close_client():
+    await client.aclose()
 
 # Load model and encoder (best-effort)
 classifier = None
@@ -42,6 +54,36 @@ if os.path.exists(MODEL_PATH):
     except Exception as e:
         load_errors.append(f"classifier load: {e}")
 
+@app.on_event("startup")
+async def _warm_models():
+    # pay model construction and graph tracing before the first request
+    try:
+        await asyncio.to_thread(warm_up, CROP_SIZE)
+    except Exception as e:
+        load_errors.append(f"embedder warm-up: {e}")
+    if classifier is not None:
+        try:
+            n_features = getattr(classifier, "n_features_in_", 2048)
+            await asyncio.to_thread(classifier.predict, np.zeros((1, n_features), dtype=np.float32))
+        except Exception as e:
+            load_errors.append(f"classifier warm-up: {e}")
+
+# encoder classes indexed directly by the classifier's integer codes
+CLASSES = np.asarray(label_encoder.classes_) if label_encoder is not None else None
+
+# exact (lowercased) labels that count as emergency vehicles: every encoder
+# class containing a keyword, plus the bare keywords themselves
+EMERGENCY_KEYWORDS = ("ambulance", "emergency", "police", "fire")
+_classes_lower = [str(c).lower() for c in CLASSES] if CLASSES is not None else []
+EMERGENCY_LABELS = frozenset(EMERGENCY_KEYWORDS).union(
+    c for c in _classes_lower if any(k in c for k in EMERGENCY_KEYWORDS)
+)
+
+def is_emergency_label(label):
+    # exact-match fast path, else the keyword substring test for free text
+    lab = str(label).lower()
+    return lab in EMERGENCY_LABELS or any(k in lab for k in EMERGENCY_KEYWORDS)
+
 # Pydantic models for input
 class DetectedBox(BaseModel):
     lane_id: str
@@ -53,59 +95,98 @@ class DetectionPayload(BaseModel):
     detections: List[DetectedBox]
 
 # helper utils
-def decode_label(pred):
-    try:
-        if label_encoder is None:
-            return str(pred)
-        return label_encoder.inverse_transform([pred])[0]
-    except Exception:
-        return str(pred)
-
-def classify_from_embedding(emb):
-    # emb: 1D numpy array or list
+def decode_labels(preds):
+    # whole prediction vector decoded with one fancy-index into CLASSES
+    preds = np.asarray(preds)
+    if CLASSES is not None and preds.dtype.kind in "iu" and (
+        preds.size == 0 or (preds.min() >= 0 and preds.max() < len(CLASSES))
+    ):
+        return CLASSES[preds]
+    return preds.astype(str)
+
+def classify_embeddings(X):
+    # X: 2D array-like (B, D) of embeddings; one classifier call for the batch
     if classifier is None:
         raise RuntimeError("Classifier not loaded")
-    arr = np.array(emb).reshape(1, -1)
-    pred = classifier.predict(arr)[0]
+    preds = classifier.predict(np.asarray(X))
     # if classifier returns numeric, decode via label encoder else return string
-    return decode_label(pred)
+    return decode_labels(preds)
 
-def aggregate_counts(detections):
+def aggregate_counts(detections: List[DetectedBox]):
     counts = {}
+
+    # single pass: partition by how each detection is classified
+    by_kind = {"label": [], "emb": [], "img": []}
     for d in detections:
-        lane = d.get("lane_id")
-        if lane is None:
-            continue
+        lane = d.lane_id
         if lane not in counts:
             counts[lane] = {"normal": 0, "emergency": 0}
 
-        label = None
-        if d.get("pred_label"):
-            label = d["pred_label"]
-        elif d.get("embedding") is not None:
-            try:
-                label = classify_from_embedding(d["embedding"])
-            except Exception:
-                label = None
-        elif d.get("crop_base64"):
-            try:
-                img_bytes = base64.b64decode(d["crop_base64"])
-                pil = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-                emb = image_to_embedding(pil)
-                label = classify_from_embedding(emb)
-            except Exception:
-                label = None
+        if d.pred_label:
+            by_kind["label"].append(d)
+        elif d.embedding is not None:
+            by_kind["emb"].append(d)
+        elif d.crop_base64:
+            by_kind["img"].append(d)
         else:
-            label = None
+            counts[lane]["normal"] += 1
 
-        if label:
-            lab = str(label).lower()
-            if any(x in lab for x in ("ambulance","emergency","police","fire")):
-                counts[lane]["emergency"] += 1
-            else:
+    # already classified by the client: no inference needed
+    for d in by_kind["label"]:
+        kind = "emergency" if is_emergency_label(d.pred_label) else "normal"
+        counts[d.lane_id][kind] += 1
+
+    # embeddings (given or computed from crops) share one classifier call
+    emb_rows = [np.asarray(d.embedding, dtype=np.float32) for d in by_kind["emb"]]
+    emb_lanes = [d.lane_id for d in by_kind["emb"]]
+
+    # decode crops, then one ResNet forward for all of them
+    crops, crop_lanes = [], []
+    for d in by_kind["img"]:
+        try:
+            img_bytes = pybase64.b64decode(d.crop_base64, validate=False)
+            pil = Image.open(io.BytesIO(img_bytes))
+            pil.draft("RGB", CROP_SIZE)  # JPEG: downscale during decode; no-op otherwise
+            crops.append(pil.convert("RGB"))
+            crop_lanes.append(d.lane_id)
+        except Exception:
+            counts[d.lane_id]["normal"] += 1
+    if crops:
+        try:
+            emb_rows.extend(images_to_embeddings(crops))
+            emb_lanes.extend(crop_lanes)
+        except Exception:
+            for lane in crop_lanes:
                 counts[lane]["normal"] += 1
-        else:
-            counts[lane]["normal"] += 1
+
+    # one classifier call and one decode; unclassified detections count as normal
+    is_emergency = [False] * len(emb_rows)
+    if emb_rows and classifier is not None:
+        n_features = getattr(classifier, "n_features_in_", None)
+        keep = [
+            j for j, e in enumerate(emb_rows)
+            if e.ndim == 1 and (n_features is None or e.shape[0] == n_features) and np.isfinite(e).all()
+        ]
+        if keep:
+            try:
+                labels = list(classify_embeddings(np.vstack([emb_rows[j] for j in keep])))
+            except Exception:
+                # fall back to one row at a time so a bad row only costs itself
+                labels, classified = [], []
+                for j in keep:
+                    try:
+                        labels.append(classify_embeddings(emb_rows[j].reshape(1, -1))[0])
+                        classified.append(j)
+                    except Exception:
+                        pass
+                keep = classified
+            # one label check per distinct class rather than per row
+            uniq, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+            uniq_flags = np.array([is_emergency_label(u) for u in uniq], dtype=bool)
+            for j, flag in zip(keep, uniq_flags[inverse.reshape(-1)].tolist()):
+                is_emergency[j] = flag
+    for lane, emergency in zip(emb_lanes, is_emergency):
+        counts[lane]["emergency" if emergency else "normal"] += 1
 
     # format list of dicts for traffic API
     out = []
@@ -114,19 +195,22 @@ def aggregate_counts(detections):
     return out
 
 @app.post("/predict_and_update")
-def predict_and_update(payload: DetectionPayload):
+async def predict_and_update(payload: DetectionPayload):
     if load_errors:
         # still proceed but warn
         warning = {"load_errors": load_errors}
     else:
         warning = None
 
-    detections = [d.dict() for d in payload.detections]
-    lane_input = aggregate_counts(detections)
+    detections = payload.detections
+    # classification is CPU-bound; keep the event loop free for other requests
+    guard = EMB_SEM if any(d.crop_base64 for d in detections) else contextlib.nullcontext()
+    async with guard:
+        lane_input = await asyncio.to_thread(aggregate_counts, detections)
 
     # POST to traffic controller; increase timeout for sleeping services
     try:
-        resp = requests.post(TRAFFIC_API_URL, json=lane_input, timeout=60)
+        resp = await client.post(TRAFFIC_API_URL, json=lane_input)
         resp.raise_for_status()
         controller_resp = resp.json()
     except Exception as e:
@@ -139,5 +223,5 @@ def predict_and_update(payload: DetectionPayload):
 
 # simple test endpoint
 @app.get("/status")
-def status():
+async def status():
     return {"classifier_loaded": classifier is not None, "encoder_loaded": label_encoder is not None, "load_errors": load_errors}